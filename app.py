@@ -1,10 +1,20 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, Response, stream_with_context, url_for
 import json
+import itertools
+import math
+import re
 from datetime import datetime
 import random
 import time
 
+import profiling
+import subnet_calc
+import tcp_simulator
+
 app = Flask(__name__)
+# Bounds bulk subnet uploads; 64 MB holds well over a million prefixes
+app.config['MAX_CONTENT_LENGTH'] = 64 * 1024 * 1024
+profiling.init_app(app)
 
 # Enhanced networking data with more comprehensive information
 network_protocols = {
@@ -113,6 +123,28 @@ performance_metrics = {
     "mtu": {"unit": "bytes", "description": "Maximum transmission unit", "optimal": "1500 bytes (Ethernet)"}
 }
 
+network_topology = {
+    "nodes": [
+        {"id": "internet", "type": "cloud", "label": "Internet", "status": "active"},
+        {"id": "firewall", "type": "security", "label": "Next-Gen Firewall", "status": "active"},
+        {"id": "router", "type": "router", "label": "Core Router", "status": "active"},
+        {"id": "switch1", "type": "switch", "label": "Access Switch A", "status": "active"},
+        {"id": "switch2", "type": "switch", "label": "Access Switch B", "status": "active"},
+        {"id": "server", "type": "server", "label": "Web Server", "status": "active"},
+        {"id": "db", "type": "database", "label": "Database Server", "status": "active"},
+        {"id": "wifi", "type": "wireless", "label": "WiFi Access Point", "status": "active"}
+    ],
+    "links": [
+        {"source": "internet", "target": "firewall", "bandwidth": "10 Gbps", "latency": "12 ms", "utilization": "45%"},
+        {"source": "firewall", "target": "router", "bandwidth": "10 Gbps", "latency": "0.1 ms", "utilization": "38%"},
+        {"source": "router", "target": "switch1", "bandwidth": "1 Gbps", "latency": "0.2 ms", "utilization": "62%"},
+        {"source": "router", "target": "switch2", "bandwidth": "1 Gbps", "latency": "0.2 ms", "utilization": "55%"},
+        {"source": "switch1", "target": "server", "bandwidth": "1 Gbps", "latency": "0.1 ms", "utilization": "40%"},
+        {"source": "switch2", "target": "db", "bandwidth": "1 Gbps", "latency": "0.1 ms", "utilization": "30%"},
+        {"source": "switch1", "target": "wifi", "bandwidth": "1 Gbps", "latency": "2 ms", "utilization": "25%"}
+    ]
+}
+
 
 # Enhanced route handlers
 @app.route('/')
@@ -287,28 +319,7 @@ def api_trace_route():
 @app.route('/api/network-topology')
 def api_network_topology():
     """Enhanced network topology with realistic infrastructure"""
-    topology = {
-        "nodes": [
-            {"id": "internet", "type": "cloud", "label": "Internet", "status": "active"},
-            {"id": "firewall", "type": "security", "label": "Next-Gen Firewall", "status": "active"},
-            {"id": "router", "type": "router", "label": "Core Router", "status": "active"},
-            {"id": "switch1", "type": "switch", "label": "Access Switch A", "status": "active"},
-            {"id": "switch2", "type": "switch", "label": "Access Switch B", "status": "active"},
-            {"id": "server", "type": "server", "label": "Web Server", "status": "active"},
-            {"id": "db", "type": "database", "label": "Database Server", "status": "active"},
-            {"id": "wifi", "type": "wireless", "label": "WiFi Access Point", "status": "active"}
-        ],
-        "links": [
-            {"source": "internet", "target": "firewall", "bandwidth": "10 Gbps", "utilization": "45%"},
-            {"source": "firewall", "target": "router", "bandwidth": "10 Gbps", "utilization": "38%"},
-            {"source": "router", "target": "switch1", "bandwidth": "1 Gbps", "utilization": "62%"},
-            {"source": "router", "target": "switch2", "bandwidth": "1 Gbps", "utilization": "55%"},
-            {"source": "switch1", "target": "server", "bandwidth": "1 Gbps", "utilization": "40%"},
-            {"source": "switch2", "target": "db", "bandwidth": "1 Gbps", "utilization": "30%"},
-            {"source": "switch1", "target": "wifi", "bandwidth": "1 Gbps", "utilization": "25%"}
-        ]
-    }
-    return jsonify(topology)
+    return jsonify(network_topology)
 
 
 @app.route('/api/bandwidth-calculator')
@@ -372,6 +383,181 @@ def api_network_health():
     return jsonify(health_data)
 
 
+def _tcp_sim_params():
+    """Simulation parameters from a JSON body or the query string"""
+    raw = request.get_json(silent=True)
+    if raw is None:
+        raw = request.args.to_dict()
+    return tcp_simulator.normalize_params(raw)
+
+
+@app.route('/api/tcp-simulation', methods=['GET', 'POST'])
+def api_tcp_simulation():
+    """TCP congestion-control simulation over the network topology"""
+    try:
+        result = tcp_simulator.simulate(network_topology, _tcp_sim_params())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(result)
+
+
+@app.route('/api/tcp-simulation/stream', methods=['GET', 'POST'])
+def api_tcp_simulation_stream():
+    """Server-sent progress events for long simulations, ending with the result"""
+    try:
+        events = tcp_simulator.simulate_stream(network_topology, _tcp_sim_params())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def generate():
+        for kind, data in events:
+            yield f"event: {kind}\ndata: {json.dumps(data)}\n\n"
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache"})
+
+
+@app.route('/api/profile', methods=['POST'])
+def api_profile_start():
+    """Start sampling every worker for N seconds; fetch the result from the returned URL"""
+    if not profiling.token_valid(request.headers.get(profiling.TOKEN_HEADER)):
+        return jsonify({"error": "Profiler access denied"}), 403
+    try:
+        seconds = float(request.args.get('seconds', 10))
+    except ValueError:
+        seconds = math.nan
+    if not 1 <= seconds <= profiling.MAX_SECONDS:
+        return jsonify({"error": f"seconds must be between 1 and {profiling.MAX_SECONDS}"}), 400
+
+    try:
+        profile_id, ready_at = profiling.start_profile(seconds)
+    except profiling.ProfilerBusy as e:
+        return jsonify({"error": str(e)}), 409
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 503
+    return jsonify({
+        "id": profile_id,
+        "seconds": seconds,
+        "ready_at": datetime.fromtimestamp(ready_at).isoformat(),
+        "result": url_for('api_profile_result', profile_id=profile_id)
+    }), 202
+
+
+@app.route('/api/profile/<profile_id>')
+def api_profile_result(profile_id):
+    """Merged collapsed stacks (or an SVG flame graph) for a finished profile"""
+    if not profiling.token_valid(request.headers.get(profiling.TOKEN_HEADER)):
+        return jsonify({"error": "Profiler access denied"}), 403
+    if not re.fullmatch(r'[0-9a-f]{32}', profile_id):
+        return jsonify({"error": "Unknown profile"}), 404
+    try:
+        result = profiling.collect_profile(profile_id)
+    except KeyError:
+        return jsonify({"error": "Unknown profile"}), 404
+    if result is None:
+        return jsonify({"status": "running"}), 202, {"Retry-After": "1"}
+
+    stacks, workers = result
+    headers = {"X-Profiled-Workers": str(workers)}
+    if request.args.get('format') == 'svg':
+        headers["Content-Disposition"] = f"attachment; filename=flamegraph-{profile_id}.svg"
+        title = f"tcp-ip.ch - profile {profile_id[:8]} across {workers} worker(s)"
+        return Response(profiling.render_flamegraph(stacks, title), mimetype='image/svg+xml', headers=headers)
+    return Response(profiling.format_collapsed(stacks), mimetype='text/plain', headers=headers)
+
+
+def _subnet_lines(field='prefixes'):
+    """Prefix lines from a JSON body field, a JSON list or a plain-text body"""
+    data = request.get_json(silent=True)
+    if data is None:
+        return request.get_data(as_text=True).splitlines()
+    values = data.get(field, []) if isinstance(data, dict) else data
+    if isinstance(values, str):
+        return values.splitlines()
+    if not isinstance(values, list):
+        raise ValueError(f"'{field}' must be a list of prefixes")
+    return [str(value) for value in values]
+
+
+def _prefix_stream(arrays):
+    """Stream PrefixArrays as one CIDR per line"""
+    return Response(itertools.chain.from_iterable(map(subnet_calc.prefix_chunks, arrays)), mimetype='text/plain')
+
+
+@app.errorhandler(413)
+def request_too_large(e):
+    """JSON error for bodies over MAX_CONTENT_LENGTH (bulk subnet uploads)"""
+    limit = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    return jsonify({"error": f"Request body exceeds {limit} MB"}), 413
+
+
+@app.route('/api/subnet')
+def api_subnet():
+    """Subnet calculator: network, broadcast, host range and wildcard for one prefix"""
+    try:
+        return jsonify(subnet_calc.describe(request.args.get('prefix', '192.168.1.0/24')))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@app.route('/api/subnet/aggregate', methods=['POST'])
+def api_subnet_aggregate():
+    """Aggregate (supernet) a bulk prefix list into the minimal covering list"""
+    try:
+        v4, v6 = subnet_calc.load_prefixes(_subnet_lines())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return _prefix_stream([subnet_calc.aggregate(v4), subnet_calc.aggregate(v6)])
+
+
+@app.route('/api/subnet/overlaps', methods=['POST'])
+def api_subnet_overlaps():
+    """Report every prefix that falls inside another prefix of the list"""
+    try:
+        v4, v6 = subnet_calc.load_prefixes(_subnet_lines())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def generate():
+        for prefixes in (v4, v6):
+            for inner, outer in subnet_calc.overlaps(prefixes):
+                yield json.dumps({"prefix": subnet_calc.format_prefix(prefixes.version, *inner),
+                                  "contained_in": subnet_calc.format_prefix(prefixes.version, *outer)}) + "\n"
+
+    return Response(subnet_calc.stream_lines(generate()), mimetype='application/x-ndjson')
+
+
+@app.route('/api/subnet/difference', methods=['POST'])
+def api_subnet_difference():
+    """Addresses in 'prefixes' but not in 'exclude', as a minimal prefix list"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or 'prefixes' not in data:
+        return jsonify({"error": "Send a JSON object with 'prefixes' and 'exclude' lists"}), 400
+    try:
+        v4, v6 = subnet_calc.load_prefixes(_subnet_lines('prefixes'))
+        exclude_v4, exclude_v6 = subnet_calc.load_prefixes(_subnet_lines('exclude'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return _prefix_stream([subnet_calc.difference(v4, exclude_v4), subnet_calc.difference(v6, exclude_v6)])
+
+
+@app.route('/api/subnet/split', methods=['POST'])
+def api_subnet_split():
+    """VLSM allocation for host counts, or an equal split into a longer prefix"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Send a JSON object with 'prefix' and 'hosts' or 'new_prefix'"}), 400
+    try:
+        version, network, length = subnet_calc.parse_network(str(data.get('prefix', '')))
+        if 'hosts' in data:
+            return jsonify({"prefix": subnet_calc.format_prefix(version, network, length),
+                            "subnets": subnet_calc.vlsm(version, network, length, data['hosts'])})
+        subnets = subnet_calc.split(version, network, length, data.get('new_prefix', length + 1))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return _prefix_stream(subnets)
+
+
 if __name__ == '__main__':
     print("🌐 Starting tcp-ip.ch - The Ultimate TCP/IP Learning Platform")
     print("📚 Comprehensive networking education at your fingertips")
@@ -0,0 +1,463 @@
+"""
+On-demand sampling profiler and per-request span timing
+
+The profiler is coordinated through a small control file so that a single
+request to the profile endpoint starts sampling in every worker process; each
+worker writes its collapsed stacks next to the control file, and a later
+request merges them, so no worker is held for the length of the profile.
+Span timing is switched on per request with the X-Trace header and reported
+in a Server-Timing response header and the application log.
+"""
+
+import hmac
+import json
+import logging
+import os
+import stat
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from html import escape
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+from flask.signals import template_rendered
+from flask.templating import Environment
+
+TOKEN_ENV = "PROFILER_TOKEN"
+TOKEN_HEADER = "X-Profiler-Token"
+TRACE_KEY = "tcpip.trace"
+MAX_SECONDS = 60
+POLL_INTERVAL = 0.5
+RESULT_TTL = 3600  # seconds a finished profile stays downloadable
+
+PROFILE_DIR = os.environ.get("PROFILER_DIR", os.path.join(tempfile.gettempdir(), "tcpip-profiler"))
+CONTROL_FILE = os.path.join(PROFILE_DIR, "control.json")
+
+logger = logging.getLogger(__name__)
+
+
+def token_valid(supplied):
+    """True when PROFILER_TOKEN is configured and matches the supplied value"""
+    expected = os.environ.get(TOKEN_ENV)
+    if not expected or not supplied:
+        return False
+    return hmac.compare_digest(expected.encode(), supplied.encode())
+
+
+# Sampling profiler
+
+class SamplingProfiler(threading.Thread):
+    """Periodically records the stack of every other thread in this process"""
+
+    def __init__(self, until, interval, output):
+        super().__init__(name="sampling-profiler", daemon=True)
+        self.until = until
+        self.interval = interval
+        self.output = output
+        self.stacks = Counter()
+        self._labels = {}
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def sample(self):
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own or thread_id == _watcher_ident:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def run(self):
+        while time.time() < self.until:
+            self.sample()
+            time.sleep(self.interval)
+        tmp_path = f"{self.output}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(format_collapsed(self.stacks))
+        os.replace(tmp_path, self.output)
+
+
+def format_collapsed(stacks):
+    """Render stack counts in the collapsed 'frame;frame;frame count' format"""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def parse_collapsed(text, into=None):
+    stacks = into if into is not None else Counter()
+    for line in text.splitlines():
+        stack, _, count = line.rpartition(" ")
+        if stack and count.isdigit():
+            stacks[stack] += int(count)
+    return stacks
+
+
+class ProfilerBusy(RuntimeError):
+    """Raised when a profile is requested while another one is still running"""
+
+
+def _ensure_private_dir():
+    """Create PROFILE_DIR if needed and refuse it unless only this user can write it
+
+    The directory holds the control file that starts sampling in every worker,
+    so a directory created (or swapped for a symlink) by another local user
+    must not be trusted.
+    """
+    try:
+        os.makedirs(PROFILE_DIR, mode=0o700, exist_ok=True)
+        info = os.lstat(PROFILE_DIR)
+    except OSError as e:
+        raise RuntimeError(f"Cannot create profiler directory {PROFILE_DIR}: {e}")
+    foreign = hasattr(os, "getuid") and info.st_uid != os.getuid()
+    if not stat.S_ISDIR(info.st_mode) or foreign or info.st_mode & 0o077:
+        raise RuntimeError(f"Profiler directory {PROFILE_DIR} must be a real directory "
+                           f"owned by this user with mode 0700")
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+_watcher_lock = threading.Lock()
+_watcher_pid = None
+_watcher_ident = None
+
+
+def _watch_control_file():
+    seen = None
+    while True:
+        # A malformed control file or a failed thread start must not end the watcher
+        try:
+            control = _read_json(CONTROL_FILE)
+            if control and control["id"] != seen and control["until"] > time.time():
+                seen = control["id"]
+                output = os.path.join(PROFILE_DIR, f"{control['id']}-{os.getpid()}.folded")
+                SamplingProfiler(control["until"], control["interval"], output).start()
+        except Exception:
+            logger.exception("Profiler watcher failed to process %s", CONTROL_FILE)
+        time.sleep(POLL_INTERVAL)
+
+
+def ensure_watcher():
+    """Start this process's control-file watcher if profiling is configured
+
+    Raises RuntimeError when the profiler directory is not private.
+    """
+    global _watcher_pid, _watcher_ident
+    if _watcher_pid == os.getpid() or not os.environ.get(TOKEN_ENV):
+        return
+    with _watcher_lock:
+        if _watcher_pid == os.getpid():
+            return
+        _ensure_private_dir()
+        watcher = threading.Thread(target=_watch_control_file, name="profiler-watcher", daemon=True)
+        watcher.start()
+        _watcher_ident = watcher.ident
+        _watcher_pid = os.getpid()
+
+
+def _restart_watcher_after_fork():
+    # Threads do not survive fork (e.g. gunicorn --preload); restart in the child
+    global _watcher_lock
+    if _watcher_pid is not None and _watcher_pid != os.getpid():
+        _watcher_lock = threading.Lock()
+        try:
+            ensure_watcher()
+        except RuntimeError:
+            pass
+
+
+_start_lock = threading.Lock()
+
+
+def start_profile(seconds, interval=0.005):
+    """Ask every worker to sample for `seconds`; returns (profile id, ready time)
+
+    Raises ProfilerBusy while an earlier profile is still sampling.
+    """
+    _ensure_private_dir()
+    ensure_watcher()
+    with _start_lock, _exclusive(os.path.join(PROFILE_DIR, "control.lock")):
+        control = _read_json(CONTROL_FILE)
+        if control and control["until"] > time.time():
+            raise ProfilerBusy(f"Profile {control['id']} is still running")
+        _remove_stale_results()
+        profile_id = uuid.uuid4().hex
+        # Watchers poll, so allow one interval for every worker to pick the run up
+        until = time.time() + POLL_INTERVAL + seconds
+        _write_json(os.path.join(PROFILE_DIR, f"{profile_id}.run.json"), {"until": until})
+        _write_json(CONTROL_FILE, {"id": profile_id, "until": until, "interval": interval})
+    return profile_id, until + 2 * POLL_INTERVAL
+
+
+def collect_profile(profile_id):
+    """Merged stack counts and worker count for a finished profile
+
+    Returns None while the profile is still running and raises KeyError for
+    an unknown id.
+    """
+    run = _read_json(os.path.join(PROFILE_DIR, f"{profile_id}.run.json"))
+    if run is None:
+        raise KeyError(profile_id)
+    # Give every sampler time to flush its output after sampling stops
+    if time.time() < run["until"] + 2 * POLL_INTERVAL:
+        return None
+    stacks = Counter()
+    workers = 0
+    for name in os.listdir(PROFILE_DIR):
+        if name.startswith(f"{profile_id}-") and name.endswith(".folded"):
+            with open(os.path.join(PROFILE_DIR, name)) as f:
+                parse_collapsed(f.read(), stacks)
+            workers += 1
+    return stacks, workers
+
+
+def _remove_stale_results():
+    cutoff = time.time() - RESULT_TTL
+    for name in os.listdir(PROFILE_DIR):
+        if name.endswith((".folded", ".run.json")):
+            path = os.path.join(PROFILE_DIR, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+@contextmanager
+def _exclusive(path):
+    """Cross-process lock where fcntl exists; the thread lock covers the rest"""
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def render_flamegraph(stacks, title="Flame Graph", width=1200, row_height=16):
+    """Render collapsed stack counts as a standalone SVG flame graph"""
+    root = {"children": {}, "count": 0}
+    for stack, count in stacks.items():
+        root["count"] += count
+        node = root
+        for frame in stack.split(";"):
+            node = node["children"].setdefault(frame, {"children": {}, "count": 0})
+            node["count"] += count
+
+    rects = []
+    depth_max = 0
+    total = root["count"] or 1
+    pending = [(root["children"], 0.0, 0)]
+    while pending:
+        children, x, depth = pending.pop()
+        depth_max = max(depth_max, depth)
+        for name in sorted(children):
+            node = children[name]
+            w = node["count"] / total * width
+            if w >= 0.5:
+                rects.append((x, depth, w, name, node["count"]))
+                pending.append((node["children"], x, depth + 1))
+            x += w
+
+    height = (depth_max + 2) * row_height + 24
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="monospace" font-size="11">',
+        f'<rect width="100%" height="100%" fill="#0a0e27"/>',
+        f'<text x="{width / 2}" y="16" fill="#00d4ff" text-anchor="middle">{escape(title)}</text>',
+    ]
+    for x, depth, w, name, count in rects:
+        y = height - (depth + 1) * row_height
+        hue = 20 + zlib.crc32(name.encode()) % 40
+        label = escape(name)
+        parts.append(
+            f'<g><title>{label} ({count} samples, {count / total * 100:.2f}%)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row_height - 1}" '
+            f'fill="hsl({hue},90%,55%)"/>'
+        )
+        if w > 40:
+            chars = int(w / 7)
+            text = label if len(name) <= chars else escape(name[:max(chars - 2, 0)]) + ".."
+            parts.append(f'<text x="{x + 3:.1f}" y="{y + row_height - 4}">{text}</text>')
+        parts.append("</g>")
+    parts.append("</svg>")
+    return "\n".join(parts)
+
+
+# Per-request span timing
+
+class RequestTrace:
+    """Accumulated span durations for one traced request"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.marks = {}
+        self.spans = {}
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def server_timing(self):
+        return ", ".join(f"{name};dur={seconds * 1e3:.3f}" for name, seconds in self.spans.items())
+
+
+def _current_trace():
+    try:
+        return request.environ.get(TRACE_KEY)
+    except RuntimeError:
+        return None
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON provider that records serialization time on traced requests"""
+
+    def response(self, *args, **kwargs):
+        trace = _current_trace()
+        if trace is None:
+            return super().response(*args, **kwargs)
+        started = time.perf_counter()
+        response = super().response(*args, **kwargs)
+        trace.add("jsonify", time.perf_counter() - started)
+        return response
+
+
+class TracingMiddleware:
+    """WSGI wrapper that times routing, the handler and the response write"""
+
+    def __init__(self, app, wsgi_app):
+        self.app = app
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        if environ.get("HTTP_X_TRACE", "").strip() != "1" or not token_valid(environ.get("HTTP_X_PROFILER_TOKEN")):
+            return self.wsgi_app(environ, start_response)
+        trace = environ[TRACE_KEY] = RequestTrace()
+        body = self.wsgi_app(environ, start_response)
+        return TimedBody(self.app, environ, trace, body)
+
+
+class TimedBody:
+    """Response iterable that finishes the trace when the server closes it
+
+    The WSGI server always calls close(), even when the client disconnects
+    before the body is consumed, so the write span and log entry go there
+    (as with werkzeug's ClosingIterator) rather than after the last chunk.
+    """
+
+    def __init__(self, app, environ, trace, body):
+        self.app = app
+        self.environ = environ
+        self.trace = trace
+        self.body = body
+        self.iterator = iter(body)
+        self.started = time.perf_counter()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.iterator)
+
+    def close(self):
+        try:
+            if hasattr(self.body, "close"):
+                self.body.close()
+        finally:
+            trace = self.trace
+            trace.add("write", time.perf_counter() - self.started)
+            trace.add("total", time.perf_counter() - trace.start)
+            self.app.logger.info("trace %s %s %s", self.environ.get("REQUEST_METHOD"),
+                                 self.environ.get("PATH_INFO"), trace.server_timing())
+
+
+def _on_before_request():
+    trace = request.environ.get(TRACE_KEY)
+    if trace is not None:
+        now = time.perf_counter()
+        trace.add("routing", now - trace.start)
+        trace.marks["handler"] = now
+
+
+def _on_after_request(response):
+    trace = request.environ.get(TRACE_KEY)
+    if trace is not None:
+        handler = time.perf_counter() - trace.marks.pop("handler", trace.start)
+        # Template rendering and serialization are reported as their own spans
+        trace.add("handler", handler - trace.spans.get("render_template", 0.0)
+                  - trace.spans.get("jsonify", 0.0))
+        response.headers["Server-Timing"] = trace.server_timing()
+    return response
+
+
+class TimedEnvironment(Environment):
+    """Jinja environment that starts the render_template span at template lookup
+
+    Flask's before_render_template signal fires only after the template has
+    been loaded and compiled, so the span starts here to include that work.
+    """
+
+    def get_or_select_template(self, *args, **kwargs):
+        trace = _current_trace()
+        if trace is not None:
+            trace.marks["render_template"] = time.perf_counter()
+        return super().get_or_select_template(*args, **kwargs)
+
+
+def _on_rendered(sender, template, context, **extra):
+    trace = _current_trace()
+    if trace is not None and "render_template" in trace.marks:
+        trace.add("render_template", time.perf_counter() - trace.marks.pop("render_template"))
+
+
+def init_app(app):
+    """Install the profiler watcher and request tracing hooks on a Flask app
+
+    Must run before anything touches app.jinja_env. Without --preload,
+    gunicorn imports the app in each worker, so every worker starts its
+    watcher here rather than on its first request.
+    """
+    app.jinja_environment = TimedEnvironment
+    app.json = TimedJSONProvider(app)
+    app.wsgi_app = TracingMiddleware(app, app.wsgi_app)
+    try:
+        ensure_watcher()
+    except RuntimeError as e:
+        app.logger.error("Sampling profiler disabled: %s", e)
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=_restart_watcher_after_fork)
+    app.before_request(_on_before_request)
+    app.after_request(_on_after_request)
+    template_rendered.connect(_on_rendered, app)
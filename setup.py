@@ -121,6 +121,9 @@ PORT=5000
 # Optional: Database configuration
 # DATABASE_URL=sqlite:///networkHub.db
 
+# Optional: Enable /api/profile and X-Trace request spans
+# PROFILER_TOKEN=your-profiler-token
+
 # Optional: External API keys
 # MONITORING_API_KEY=your-api-key
 # ANALYTICS_API_KEY=your-api-key
@@ -0,0 +1,641 @@
+"""
+Subnet / CIDR calculator and bulk prefix operations
+
+Bulk operations keep prefixes in NumPy arrays of unsigned 64-bit words
+instead of ipaddress objects or Python integers. Well-formed lines are
+parsed column by column over a character matrix, aggregation is one sort
+of integer keys followed by a running maximum of the end addresses, and
+overlap detection, set difference and range-to-CIDR conversion are whole
+array operations too, so no step loops over the prefixes in Python.
+"""
+
+import socket
+from itertools import islice
+
+import numpy as np
+
+MASK64 = (1 << 64) - 1
+MAX_SPLIT_SUBNETS = 1 << 24
+MAX_PREFIXES = 2000000  # per list in one request
+STREAM_CHUNK = 4096  # lines per streamed chunk
+PARSE_BLOCK = 1 << 16  # lines per vectorised parsing step
+IPV4_WIDTH = len("255.255.255.255/32")
+IPV6_WIDTH = len("ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff/128")
+
+_HEX_DIGITS = np.full(256, 255, np.uint8)
+_HEX_DIGITS[48:58] = range(10)  # 0-9
+_HEX_DIGITS[65:71] = range(10, 16)  # A-F
+_HEX_DIGITS[97:103] = range(10, 16)  # a-f
+
+
+def _mask_tables(bits):
+    """Host masks indexed by prefix length, as one uint64 table per word"""
+    masks = [(1 << (bits - length)) - 1 for length in range(bits + 1)]
+    if bits == 32:
+        return (np.array(masks, np.uint64),)
+    return np.array([mask >> 64 for mask in masks], np.uint64), np.array([mask & MASK64 for mask in masks], np.uint64)
+
+
+_HOSTMASKS = {4: _mask_tables(32), 6: _mask_tables(128)}
+
+
+class PrefixArray:
+    """IPv4 or IPv6 prefixes of one address family as packed NumPy arrays
+
+    Networks are tuples of uint64 word arrays, most significant word first:
+    one word per IPv4 network, two (high, low) per IPv6 network.
+    """
+
+    def __init__(self, version, words=None, lengths=None):
+        self.version = version
+        self.bits = 32 if version == 4 else 128
+        if words is None:
+            words = [()] * (1 if version == 4 else 2)
+        self.words = tuple(np.asarray(word, dtype=np.uint64) for word in words)
+        self.lengths = np.asarray(lengths if lengths is not None else (), dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def networks(self, index=slice(None)):
+        """Networks (optionally only those at index) as Python integers"""
+        words = _take(self.words, index)
+        if self.version == 4:
+            return words[0].tolist()
+        return [(high << 64) | low for high, low in zip(words[0].tolist(), words[1].tolist())]
+
+
+def _netmask(bits, length):
+    return ((1 << bits) - 1) ^ ((1 << (bits - length)) - 1)
+
+
+def _parse_length(text, bits):
+    """Prefix length from plain ASCII digits (int() would also take '2_4', '+24')"""
+    if not (text.isascii() and text.isdigit()) or int(text) > bits:
+        raise ValueError(text)
+    return int(text)
+
+
+def parse_prefix(text):
+    """Parse '10.0.0.1/24' or a bare address into (version, address, length)
+
+    The address keeps any host bits; callers mask them as needed.
+    """
+    address, sep, length = text.strip().partition("/")
+    try:
+        if ":" in address:
+            version, bits = 6, 128
+            value = int.from_bytes(socket.inet_pton(socket.AF_INET6, address), "big")
+        else:
+            version, bits = 4, 32
+            value = int.from_bytes(socket.inet_pton(socket.AF_INET, address), "big")
+    except (OSError, ValueError):  # ValueError: embedded NUL character
+        raise ValueError(f"Invalid prefix: {text.strip()!r}")
+    try:
+        length = _parse_length(length, bits) if sep else bits
+    except ValueError:
+        raise ValueError(f"Invalid prefix length in {text.strip()!r}")
+    return version, value, length
+
+
+def parse_network(text):
+    """Like parse_prefix, but with the host bits cleared"""
+    version, address, length = parse_prefix(text)
+    return version, address & _netmask(32 if version == 4 else 128, length), length
+
+
+def format_address(version, value):
+    if version == 4:
+        return socket.inet_ntop(socket.AF_INET, value.to_bytes(4, "big"))
+    return socket.inet_ntop(socket.AF_INET6, value.to_bytes(16, "big"))
+
+
+def format_prefix(version, network, length):
+    return f"{format_address(version, network)}/{length}"
+
+
+def describe(text):
+    """Single-prefix calculation: network, broadcast, host range and masks"""
+    version, address, length = parse_prefix(text)
+    bits = 32 if version == 4 else 128
+    netmask = _netmask(bits, length)
+    hostmask = netmask ^ ((1 << bits) - 1)
+    network = address & netmask
+    last = network | hostmask
+    total = 1 << (bits - length)
+
+    if version == 6 or length >= bits - 1:
+        # IPv6 has no broadcast address; /31 and /32 use every address (RFC 3021)
+        first_host, last_host, usable, broadcast = network, last, total, None
+    else:
+        first_host, last_host, usable, broadcast = network + 1, last - 1, total - 2, last
+
+    return {
+        "input": text.strip(),
+        "version": f"IPv{version}",
+        "address": format_address(version, address),
+        "network": format_prefix(version, network, length),
+        "prefix_length": length,
+        "netmask": format_address(version, netmask),
+        "wildcard": format_address(version, hostmask),
+        "broadcast": format_address(version, broadcast) if broadcast is not None else None,
+        "first_host": format_address(version, first_host),
+        "last_host": format_address(version, last_host),
+        "total_addresses": total,
+        "usable_hosts": usable,
+    }
+
+
+# Multi-word arithmetic: a value is a tuple of uint64 arrays, most significant
+# word first. NumPy wraps around on overflow, so carries are propagated here.
+
+def _take(words, index):
+    return tuple(word[index] for word in words)
+
+
+def _concat(*values):
+    return tuple(np.concatenate(words) for words in zip(*values))
+
+
+def _less(a, b):
+    result = a[-1] < b[-1]
+    for x, y in zip(a[-2::-1], b[-2::-1]):
+        result = (x < y) | ((x == y) & result)
+    return result
+
+
+def _equal(a, b):
+    result = a[0] == b[0]
+    for x, y in zip(a[1:], b[1:]):
+        result &= x == y
+    return result
+
+
+def _is_zero(words):
+    result = words[0] == 0
+    for word in words[1:]:
+        result &= word == 0
+    return result
+
+
+def _increment(words):
+    carry = np.ones(len(words[-1]), bool)
+    result = []
+    for word in reversed(words):
+        total = word + carry
+        carry &= total == 0
+        result.append(total)
+    return tuple(reversed(result))
+
+
+def _decrement(words):
+    borrow = np.ones(len(words[-1]), bool)
+    result = []
+    for word in reversed(words):
+        result.append(word - borrow)
+        borrow &= word == 0
+    return tuple(reversed(result))
+
+
+def _subtract(a, b):
+    borrow = np.zeros(len(a[-1]), bool)
+    result = []
+    for x, y in zip(reversed(a), reversed(b)):
+        result.append(x - y - borrow)
+        borrow = (x < y) | ((x == y) & borrow)
+    return tuple(reversed(result))
+
+
+def _add_power(words, exponent):
+    """words + 2**exponent, and a mask of the sums that overflowed"""
+    carry = np.zeros(len(words[-1]), bool)
+    result = []
+    for position, word in enumerate(reversed(words)):
+        local = exponent - 64 * position
+        step = np.where((local >= 0) & (local < 64), np.uint64(1) << np.clip(local, 0, 63).astype(np.uint64), 0)
+        total = word + step.astype(np.uint64)
+        overflow = total < word
+        total = total + carry
+        carry = overflow | (carry & (total == 0))
+        result.append(total)
+    return tuple(reversed(result)), carry | (exponent >= 64 * len(words))
+
+
+def _bit_length64(word):
+    length = np.zeros(len(word), np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = (word >> np.uint64(shift)) != 0
+        word = np.where(high, word >> np.uint64(shift), word)
+        length += high * shift
+    return length + (word != 0)
+
+
+def _bit_length(words):
+    length = np.zeros(len(words[-1]), np.int64)
+    for position, word in enumerate(reversed(words)):
+        word_length = _bit_length64(word)
+        length = np.where(word_length > 0, word_length + 64 * position, length)
+    return length
+
+
+def _trailing_zeros(words, bits):
+    """Trailing zero bits of each value, or bits for zero"""
+    zeros = np.full(len(words[-1]), bits, np.int64)
+    for position, word in reversed(list(enumerate(reversed(words)))):
+        found = word != 0
+        lowest = np.where(found, word & (~word + np.uint64(1)), 1)
+        # The lowest set bit is a power of two, which a float64 holds exactly
+        zeros = np.where(found, np.log2(lowest.astype(np.float64)).astype(np.int64) + 64 * position, zeros)
+    return zeros
+
+
+# Vectorised parsing works on a (width, lines) matrix of character codes.
+# The parsers accept only the plain forms ('a.b.c.d/n', hex groups with at
+# most one '::') and report anything else as not ok; those lines go through
+# parse_prefix instead, so the fast path never changes what is accepted.
+
+def _shifted(matrix, offset):
+    """matrix[j - offset] at each character position j, zero-filled"""
+    result = np.zeros_like(matrix)
+    if offset > 0:
+        result[offset:] = matrix[:-offset]
+    else:
+        result[:offset] = matrix[-offset:]
+    return result
+
+
+def _running_count(mask):
+    """Number of set positions up to and including each character position"""
+    counts = np.empty(mask.shape, np.uint8)
+    total = np.zeros(mask.shape[1], np.uint8)
+    for position, row in enumerate(mask):
+        total += row
+        counts[position] = total
+    return counts
+
+
+def _run_values(digits, run, radix, max_digits):
+    """Value of each digit run at its last character, and the lines with a run over max_digits"""
+    digits = digits.astype(np.uint16) * run
+    values = digits.copy()
+    contiguous = run.copy()
+    for k in range(1, max_digits):
+        contiguous[k:] &= run[:-k]
+        contiguous[:k] = False
+        values[k:] += digits[:-k] * contiguous[k:] * radix ** k
+    return values, (contiguous[max_digits:] & run[:-max_digits]).any(0)
+
+
+def _fields(values, run_end, slots, count):
+    """(count, lines) table holding each run's value in its slot"""
+    positions, rows = np.nonzero(run_end)
+    table = np.zeros((count, run_end.shape[1]), np.uint64)
+    table[np.clip(slots[positions, rows], 0, count - 1), rows] = values[positions, rows]
+    return table
+
+
+def _parse_ipv4(chars, inside):
+    """(ok, (network,), length) per line of a dotted-quad character matrix"""
+    digit = (chars >= 48) & (chars <= 57)
+    dot = chars == 46
+    slash = chars == 47
+    separator = dot | slash
+    field = _running_count(separator)  # octets are fields 0-3, the prefix length field 4
+    digit_before, digit_after = _shifted(digit, 1), _shifted(digit, -1)
+    values, too_long = _run_values(chars - 48, digit, 10, 3)
+    run_end = digit & ~digit_after
+    octet = field < 4
+    bad = inside & ~(digit | separator)
+    bad |= separator & ~(digit_before & digit_after)
+    bad |= slash & (field != 4)
+    bad |= (chars == 48) & ~digit_before & digit_after & octet  # leading zero
+    bad |= run_end & (values > 255)
+    bad |= run_end & ~octet & (values > 32)
+    has_length = slash.any(0)
+    ok = ~bad.any(0) & ~too_long & (np.count_nonzero(dot, 0) == 3) & (np.count_nonzero(slash, 0) <= 1)
+    octets = _fields(values, run_end, field, 5)
+    network = (octets[0] << np.uint64(24)) | (octets[1] << np.uint64(16)) | (octets[2] << np.uint64(8)) | octets[3]
+    return ok, (network,), np.where(has_length, octets[4], 32)
+
+
+def _parse_ipv6(chars, inside):
+    """(ok, (high, low), length) per line of an IPv6 character matrix"""
+    hex_digits = _HEX_DIGITS[chars]
+    colon = chars == 58
+    slash = chars == 47
+    decimal = (chars >= 48) & (chars <= 57)
+    in_length = _running_count(slash) > 0
+    address = inside & ~in_length
+    suffix = inside & in_length & ~slash
+    digit = address & (hex_digits < 16)
+    colon_before, colon_after = _shifted(colon, 1), _shifted(colon, -1)
+    double = colon & colon_after
+    bad = address & ~(digit | colon)
+    bad |= suffix & ~decimal
+    bad |= slash & ~_shifted(decimal, -1)
+    bad |= double & _shifted(colon_after, -1)  # ':::'
+    bad |= colon & ~colon_before & ~colon_after & ~(_shifted(digit, 1) & _shifted(digit, -1))
+    values, too_long = _run_values(hex_digits, digit, 16, 4)
+    length_values, length_too_long = _run_values(chars - 48, suffix, 10, 3)
+    group_end = digit & ~_shifted(digit, -1)
+    group_number = _running_count(group_end)
+    groups, compressed = group_number[-1], np.count_nonzero(double, 0)
+    ok = ~bad.any(0) & ~too_long & ~length_too_long & (np.count_nonzero(slash, 0) <= 1) & (compressed <= 1)
+    # '::' standing in for a single group is left to the platform's inet_pton
+    ok &= np.where(compressed == 1, groups <= 6, groups == 8)
+    # Groups after '::' move right by the number of groups it stands for
+    slot = group_number.astype(np.int16) - 1 + (_running_count(double) > 0) * (8 - groups.astype(np.int16))
+    group = _fields(values, group_end, slot, 8)
+    high, low = (group[0] << np.uint64(48)) | (group[1] << np.uint64(32)) | (group[2] << np.uint64(16)) | group[3], \
+        (group[4] << np.uint64(48)) | (group[5] << np.uint64(32)) | (group[6] << np.uint64(16)) | group[7]
+    length = (length_values * (suffix & ~_shifted(suffix, -1))).sum(0)
+    ok &= length <= 128
+    return ok, (high, low), np.where(slash.any(0), length, 128)
+
+
+def _parse_rows(version, buffer, starts, lengths, rows):
+    """Run the family's vectorised parser over the given lines, one block at a time"""
+    parser = _parse_ipv4 if version == 4 else _parse_ipv6
+    oks, words, prefix_lengths = [np.zeros(0, bool)], [PrefixArray(version).words], [np.zeros(0, np.int64)]
+    for first in range(0, len(rows), PARSE_BLOCK):
+        block = rows[first:first + PARSE_BLOCK]
+        offsets = np.arange(lengths[block].max())[:, None]
+        inside = offsets < lengths[block]
+        chars = np.where(inside, buffer[np.minimum(starts[block] + offsets, len(buffer) - 1)], np.uint8(0))
+        ok, block_words, block_lengths = parser(chars, inside)
+        oks.append(ok)
+        words.append(block_words)
+        prefix_lengths.append(block_lengths.astype(np.int64))
+    return np.concatenate(oks), _concat(*words), np.concatenate(prefix_lengths)
+
+
+def load_prefixes(lines):
+    """Parse prefixes into (IPv4, IPv6) PrefixArrays, masking off host bits
+
+    Blank lines and '#' comments are skipped; a bad line, or more than
+    MAX_PREFIXES prefixes, raises ValueError.
+    """
+    lines = list(lines)
+    lengths = np.fromiter(map(len, lines), np.int64, len(lines))
+    # Non-ASCII characters become one '?' each, so character offsets still line up
+    buffer = np.frombuffer(("\n".join(lines) + "\n").encode("ascii", "replace"), np.uint8)
+    starts = np.cumsum(lengths + 1) - lengths - 1
+    skip = (lengths == 0) | (buffer[starts] == ord("#"))
+    if len(lines) - np.count_nonzero(skip) > MAX_PREFIXES:
+        raise ValueError(f"At most {MAX_PREFIXES} prefixes are supported per list")
+    is_ipv6 = np.logical_or.reduceat(buffer == ord(":"), starts) if len(lines) else skip
+
+    parsed = {}
+    slow = [np.flatnonzero(~skip & (lengths > np.where(is_ipv6, IPV6_WIDTH, IPV4_WIDTH)))]
+    for version in (4, 6):
+        width = IPV4_WIDTH if version == 4 else IPV6_WIDTH
+        rows = np.flatnonzero(~skip & (is_ipv6 == (version == 6)) & (lengths <= width))
+        ok, words, prefix_lengths = _parse_rows(version, buffer, starts, lengths, rows)
+        hostmasks = _take(_HOSTMASKS[version], prefix_lengths[ok])
+        parsed[version] = [tuple(word[ok] & ~mask for word, mask in zip(words, hostmasks))], [prefix_lengths[ok]]
+        slow.append(rows[~ok])
+
+    # Everything the fast path turned down, in line order so the first bad line is reported
+    for row in np.sort(np.concatenate(slow)).tolist():
+        line = lines[row].strip()
+        if not line or line[0] == "#":
+            continue
+        try:
+            version, network, length = parse_network(line)
+        except ValueError:
+            raise ValueError(f"Line {row + 1}: invalid prefix {line!r}")
+        words = (network,) if version == 4 else (network >> 64, network & MASK64)
+        parsed[version][0].append(tuple(np.array([word], np.uint64) for word in words))
+        parsed[version][1].append(np.array([length]))
+    return tuple(PrefixArray(version, _concat(*words), np.concatenate(prefix_lengths))
+                 for version, (words, prefix_lengths) in sorted(parsed.items()))
+
+
+def _sorted(prefixes):
+    """(starts, ends, lengths) of the prefixes, sorted by network then length"""
+    if prefixes.version == 4:
+        keys = np.sort((prefixes.words[0] << np.uint64(8)) | prefixes.lengths)
+        starts, lengths = (keys >> np.uint64(8),), (keys & np.uint64(0xFF)).astype(np.uint8)
+    else:
+        order = np.lexsort((prefixes.lengths,) + prefixes.words[::-1])
+        starts, lengths = _take(prefixes.words, order), prefixes.lengths[order]
+    hostmasks = _take(_HOSTMASKS[prefixes.version], lengths)
+    return starts, tuple(start | mask for start, mask in zip(starts, hostmasks)), lengths
+
+
+def _running_max(words):
+    """Running maximum of word-array values"""
+    if len(words) == 1:
+        return (np.maximum.accumulate(words[0]),)
+    # Two-word values have no NumPy maximum, but their ranks do
+    order = np.lexsort(words[::-1])
+    ranks = np.empty(len(order), np.intp)
+    ranks[order] = np.arange(len(order))
+    return _take(words, order[np.maximum.accumulate(ranks)])
+
+
+def _nested(starts, reach):
+    """Mask of sorted prefixes that start inside an earlier prefix, given the running maximum end"""
+    nested = np.zeros(len(starts[0]), bool)
+    nested[1:] = ~_less(_take(reach, slice(None, -1)), _take(starts, slice(1, None)))
+    return nested
+
+
+def _containers(starts, ends):
+    """Index of each sorted prefix's innermost container, or -1
+
+    Prefixes either nest or are disjoint, and a container sorts before its
+    contents, so the container is the nearest earlier prefix ending at or
+    after this one. Each nested prefix first guesses its predecessor; while a
+    guess ends too early, nothing between the guess and the guess's own guess
+    can contain the prefix either, so it jumps there, halving the chains of
+    siblings every round.
+    """
+    nested = _nested(starts, _running_max(ends))
+    guesses = np.where(nested, np.arange(-1, len(nested) - 1), -1)
+    pending = np.flatnonzero(nested)
+    while len(pending):
+        pending = pending[_less(_take(ends, guesses[pending]), _take(ends, pending))]
+        guesses[pending] = guesses[guesses[pending]]
+        pending = pending[guesses[pending] >= 0]
+    return guesses
+
+
+def _runs(opens):
+    """Index of the first and last element of each run begun where opens is set"""
+    first = np.flatnonzero(opens)
+    return first, np.append(first[1:], len(opens))[:len(first)] - 1
+
+
+def _coalesce(starts, ends):
+    """Join sorted, disjoint ranges that touch, returning (first, last) of each run"""
+    opens = np.ones(len(starts[0]), bool)
+    opens[1:] = ~_equal(_take(starts, slice(1, None)), _increment(_take(ends, slice(None, -1))))
+    first, last = _runs(opens)
+    return _take(starts, first), _take(ends, last)
+
+
+def _merged_ranges(prefixes):
+    """Sorted, coalesced (first, last) address ranges covering every prefix"""
+    starts, ends, _ = _sorted(prefixes)
+    reach = _running_max(ends)
+    # A prefix opens a new range when it starts past every earlier end plus one
+    opens = ~_nested(starts, reach)
+    opens[1:] &= ~_equal(_take(starts, slice(1, None)), _increment(_take(reach, slice(None, -1))))
+    first, last = _runs(opens)
+    return _take(starts, first), _take(reach, last)
+
+
+def _range_prefixes(version, first, last):
+    """PrefixArray of the fewest prefixes exactly covering each [first, last] range, in address order"""
+    bits = 32 if version == 4 else 128
+    pending = np.arange(len(first[0]))
+    found_rows, found_words, found_lengths = [], [], []
+    while len(pending):
+        aligned = _trailing_zeros(first, bits)
+        count = _increment(_subtract(last, first))
+        fits = np.where(_is_zero(count), bits, _bit_length(count) - 1)  # a zero count is the whole space
+        size = np.minimum(aligned, fits)
+        found_rows.append(pending)
+        found_words.append(first)
+        found_lengths.append(bits - size)
+        first, overflow = _add_power(first, size)
+        more = ~overflow & ~_less(last, first)
+        pending, first, last = pending[more], _take(first, more), _take(last, more)
+    if not found_rows:
+        return PrefixArray(version)
+    # Each round adds the next prefix of every unfinished range, so a stable sort restores address order
+    order = np.argsort(np.concatenate(found_rows), kind="stable")
+    return PrefixArray(version, _take(_concat(*found_words), order), np.concatenate(found_lengths)[order])
+
+
+def aggregate(prefixes):
+    """Minimal PrefixArray covering the same addresses (supernetting)"""
+    return _range_prefixes(prefixes.version, *_merged_ranges(prefixes))
+
+
+def difference(prefixes, excluded):
+    """PrefixArray covering the addresses of `prefixes` that are not in `excluded`
+
+    The boundaries of both merged range lists are swept in address order:
+    an opening boundary sits just before its address and a closing one just
+    after it, and the stretch up to the next boundary is kept while inside a
+    kept range and outside every excluded one.
+    """
+    keep_first, keep_last = _merged_ranges(prefixes)
+    drop_first, drop_last = _merged_ranges(excluded)
+    kept, dropped = len(keep_first[0]), len(drop_first[0])
+    bounds = _concat(keep_first, drop_first, keep_last, drop_last)
+    closing = np.repeat([False, True], kept + dropped)
+    in_keep = np.repeat([1, 0, -1, 0], [kept, dropped, kept, dropped])
+    in_drop = np.repeat([0, 1, 0, -1], [kept, dropped, kept, dropped])
+    order = np.lexsort((closing,) + bounds[::-1])
+    bounds, closing = _take(bounds, order), closing[order]
+    keep = (np.cumsum(in_keep[order]) == 1) & (np.cumsum(in_drop[order]) == 0)
+
+    current, following = _take(bounds, slice(None, -1)), _take(bounds, slice(1, None))
+    closes, opens_next = closing[:-1], ~closing[1:]
+    starts = tuple(np.where(closes, after, word) for word, after in zip(current, _increment(current)))
+    ends = tuple(np.where(opens_next, before, word) for word, before in zip(following, _decrement(following)))
+    # Stretches past the last address or before the first one would wrap around
+    keep = keep[:-1] & ~(closes & _is_zero(starts)) & ~(opens_next & _is_zero(following))
+    rows = np.flatnonzero(keep & ~_less(ends, starts))
+    return _range_prefixes(prefixes.version, *_coalesce(_take(starts, rows), _take(ends, rows)))
+
+
+def overlaps(prefixes):
+    """Yield (prefix, containing prefix) for every prefix inside another one
+
+    Each prefix is reported against its innermost container; duplicates are
+    reported against an earlier copy.
+    """
+    starts, ends, lengths = _sorted(prefixes)
+    containers = _containers(starts, ends)
+    inner = np.flatnonzero(containers >= 0)
+    outer = containers[inner]
+    ordered = PrefixArray(prefixes.version, starts, lengths)
+    yield from zip(zip(ordered.networks(inner), lengths[inner].tolist()),
+                   zip(ordered.networks(outer), lengths[outer].tolist()))
+
+
+def split(version, network, length, new_length):
+    """Every /new_length subnet of network/length in address order, as PrefixArray chunks"""
+    bits = 32 if version == 4 else 128
+    if isinstance(new_length, bool) or not isinstance(new_length, int):
+        raise ValueError("new_prefix must be an integer")
+    if not length <= new_length <= bits:
+        raise ValueError(f"new_prefix must be between {length} and {bits}")
+    if new_length - length > MAX_SPLIT_SUBNETS.bit_length() - 1:
+        raise ValueError(f"Splitting into more than {MAX_SPLIT_SUBNETS} subnets is not supported")
+    shift, count = bits - new_length, 1 << (new_length - length)
+    high, low = np.uint64(network >> 64), np.uint64(network & MASK64)
+
+    def chunks():
+        # The network is aligned to the whole block, so OR-ing in the offsets never carries
+        for first in range(0, count, STREAM_CHUNK):
+            offsets = np.arange(first, min(first + STREAM_CHUNK, count), dtype=np.uint64)
+            if version == 4:
+                words = (low | (offsets << np.uint64(shift)),)
+            elif shift >= 64:
+                words = (high | (offsets << np.uint64(shift - 64)), np.full(len(offsets), low))
+            else:
+                carried = offsets >> np.uint64(64 - shift) if shift else np.zeros(len(offsets), np.uint64)
+                words = (high | carried, low | (offsets << np.uint64(shift)))
+            yield PrefixArray(version, words, np.full(len(offsets), new_length))
+
+    return chunks()
+
+
+def vlsm(version, network, length, hosts):
+    """Allocate variable-length subnets for host counts, largest first"""
+    bits = 32 if version == 4 else 128
+    if not hosts or any(isinstance(count, bool) or not isinstance(count, int) or count < 1 for count in hosts):
+        raise ValueError("'hosts' must be a list of positive integers")
+    # IPv4 subnets lose their network and broadcast addresses (except /31 and /32)
+    overhead = 2 if version == 4 else 0
+    cursor, end = network, network + (1 << (bits - length))
+    allocations = []
+    for index in sorted(range(len(hosts)), key=lambda i: -hosts[i]):
+        count = hosts[index]
+        if version == 4 and count <= 2:
+            needed = count
+        else:
+            needed = count + overhead
+        host_bits = (needed - 1).bit_length()
+        size = 1 << host_bits
+        if cursor + size > end:
+            raise ValueError(f"{format_prefix(version, network, length)} has no room for "
+                             f"{count} hosts (request #{index + 1})")
+        usable = size - overhead if version == 4 and host_bits > 1 else size
+        allocations.append({
+            "request": index + 1,
+            "hosts_requested": count,
+            "subnet": format_prefix(version, cursor, bits - host_bits),
+            "usable_hosts": usable,
+        })
+        cursor += size
+    return allocations
+
+
+def stream_lines(lines):
+    """Group text lines into chunks for a streamed response"""
+    lines = iter(lines)
+    while True:
+        chunk = list(islice(lines, STREAM_CHUNK))
+        if not chunk:
+            return
+        yield "".join(chunk)
+
+
+def prefix_chunks(prefixes):
+    """Format a PrefixArray as newline-terminated CIDR text, STREAM_CHUNK prefixes per chunk"""
+    ntop = socket.inet_ntop
+    family, size = (socket.AF_INET, 4) if prefixes.version == 4 else (socket.AF_INET6, 16)
+    for first in range(0, len(prefixes), STREAM_CHUNK):
+        rows = slice(first, first + STREAM_CHUNK)
+        if prefixes.version == 4:
+            packed = prefixes.words[0][rows].astype(">u4").tobytes()
+        else:
+            packed = np.column_stack(_take(prefixes.words, rows)).astype(">u8").tobytes()
+        yield "".join(f"{ntop(family, packed[offset:offset + size])}/{length}\n"
+                      for offset, length in zip(range(0, len(packed), size), prefixes.lengths[rows].tolist()))
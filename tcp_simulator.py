@@ -0,0 +1,608 @@
+"""
+Discrete-event TCP congestion-control simulator
+
+Models TCP flows (Reno, CUBIC, BBR-like) over the links of the network
+topology. Links are fluid queues integrated exactly between events, and every
+flow is driven by one event per round trip, which keeps a 100-flow, 60 second
+scenario at a few hundred thousand events.
+"""
+
+import heapq
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+MSS = 1500  # bytes per packet
+ALGORITHMS = ("reno", "cubic", "bbr")
+
+DEFAULT_PARAMS = {
+    "flows": 12,
+    "algorithms": ["reno", "cubic", "bbr"],
+    "source": "internet",
+    "destinations": ["server", "db", "wifi"],
+    "duration": 20.0,
+    "sample_interval": 0.1,
+    "buffer_packets": 1000,
+    "ecn": False,
+    "ecn_threshold_packets": 200,
+    "start_spread": 1.0,
+    "seed": 1,
+}
+
+LIMITS = {
+    "flows": (1, 500),
+    "duration": (0.1, 300.0),
+    "sample_interval": (0.01, 10.0),
+    "buffer_packets": (1, 1000000),
+    "ecn_threshold_packets": (1, 1000000),
+    "start_spread": (0.0, 300.0),
+}
+
+# Bounds on total work per request: round-trip events (estimated from each
+# flow's base RTT) and recorded series points (flows x samples).
+MAX_EVENTS = 500000
+MAX_SAMPLES = 3000
+MAX_SERIES_POINTS = 120000
+
+_UNIT_SCALE = {"": 1, "k": 1e3, "m": 1e6, "g": 1e9, "t": 1e12}
+
+
+def parse_rate(text):
+    """Convert a bandwidth label such as '10 Gbps' into bits per second"""
+    match = re.match(r"\s*([\d.]+)\s*([kmgt]?)bps\s*$", str(text), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Unrecognised bandwidth: {text!r}")
+    return float(match.group(1)) * _UNIT_SCALE[match.group(2).lower()]
+
+
+def parse_delay(text):
+    """Convert a latency label such as '5 ms' into seconds"""
+    match = re.match(r"\s*([\d.]+)\s*(ms|us|s)\s*$", str(text), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Unrecognised latency: {text!r}")
+    scale = {"s": 1.0, "ms": 1e-3, "us": 1e-6}[match.group(2).lower()]
+    return float(match.group(1)) * scale
+
+
+def _as_list(value):
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(",") if item.strip()]
+    items = list(value)
+    if not all(isinstance(item, str) for item in items):
+        raise ValueError("list items must be strings")
+    return items
+
+
+def _as_int(value):
+    """Integer from an int, an integral float or a string of digits; never a bool"""
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError(value)
+        return int(value)
+    if isinstance(value, str):
+        text = value.strip()
+        if not (text.lstrip("-").isascii() and text.lstrip("-").isdigit()):
+            raise ValueError(value)
+    return int(value)
+
+
+def _as_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+
+def normalize_params(raw):
+    """Validate request parameters and fill in defaults"""
+    if not isinstance(raw, dict):
+        raise ValueError("Parameters must be a JSON object or a query string")
+    params = dict(DEFAULT_PARAMS)
+    for key, default in DEFAULT_PARAMS.items():
+        if key not in raw or raw[key] in (None, ""):
+            continue
+        value = raw[key]
+        try:
+            if isinstance(default, bool):
+                params[key] = _as_bool(value)
+            elif isinstance(default, list):
+                params[key] = _as_list(value)
+            elif isinstance(default, int):
+                params[key] = _as_int(value)
+            elif isinstance(default, float):
+                params[key] = float(value)
+                if not math.isfinite(params[key]):
+                    raise ValueError(key)
+            else:
+                params[key] = str(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid value for '{key}': {value!r}")
+
+    for key, (low, high) in LIMITS.items():
+        if not low <= params[key] <= high:
+            raise ValueError(f"'{key}' must be between {low} and {high}")
+
+    params["algorithms"] = [name.lower() for name in params["algorithms"]]
+    unknown = [name for name in params["algorithms"] if name not in ALGORITHMS]
+    if unknown or not params["algorithms"]:
+        raise ValueError(f"'algorithms' must be chosen from {', '.join(ALGORITHMS)}")
+    if not params["destinations"]:
+        raise ValueError("'destinations' must name at least one node")
+
+    samples = params["duration"] / params["sample_interval"]
+    if samples > MAX_SAMPLES:
+        raise ValueError(f"'duration' / 'sample_interval' must not exceed {MAX_SAMPLES} samples")
+
+    if "flow_specs" in raw:
+        params["flow_specs"] = _normalize_flow_specs(raw["flow_specs"], params["duration"])
+    flows = len(params["flow_specs"]) if "flow_specs" in params else params["flows"]
+    if flows * samples > MAX_SERIES_POINTS:
+        raise ValueError(f"flows x samples must not exceed {MAX_SERIES_POINTS}; "
+                         f"use fewer flows, a shorter duration or a longer 'sample_interval'")
+    return params
+
+
+def _normalize_flow_specs(specs, duration):
+    if not isinstance(specs, list) or not 1 <= len(specs) <= LIMITS["flows"][1]:
+        raise ValueError(f"'flow_specs' must be a list of 1 to {LIMITS['flows'][1]} flows")
+    normalized = []
+    for spec in specs:
+        if not isinstance(spec, dict) or "src" not in spec or "dst" not in spec:
+            raise ValueError("Each flow spec needs 'src' and 'dst'")
+        algorithm = str(spec.get("algorithm", "reno")).lower()
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown algorithm: {algorithm!r}")
+        try:
+            start = float(spec.get("start", 0.0))
+        except (TypeError, ValueError):
+            start = math.nan
+        if not 0.0 <= start <= duration:
+            raise ValueError(f"Flow start time must be between 0 and the duration: {spec.get('start')!r}")
+        normalized.append({"src": str(spec["src"]), "dst": str(spec["dst"]),
+                           "algorithm": algorithm, "start": start})
+    return normalized
+
+
+class Link:
+    """Directed link with a fluid drop-tail queue and optional ECN marking"""
+
+    __slots__ = ("source", "target", "capacity", "delay", "buffer", "ecn_threshold",
+                 "rate", "queue", "updated", "arrived", "dropped", "marked", "flows")
+
+    def __init__(self, source, target, capacity_bps, delay, buffer_packets, ecn_threshold_packets):
+        self.source = source
+        self.target = target
+        self.capacity = capacity_bps / 8.0  # bytes per second
+        self.delay = delay
+        self.buffer = buffer_packets * MSS
+        self.ecn_threshold = ecn_threshold_packets * MSS if ecn_threshold_packets else None
+        self.rate = 0.0  # aggregate arrival rate, bytes per second
+        self.queue = 0.0
+        self.updated = 0.0
+        self.arrived = 0.0
+        self.dropped = 0.0
+        self.marked = 0.0
+        self.flows = 0
+
+    def advance(self, now):
+        """Integrate the queue up to `now` at the current arrival rate"""
+        dt = now - self.updated
+        if dt <= 0.0:
+            return
+        self.updated = now
+        inflow = self.rate * dt
+        self.arrived += inflow
+        queue = self.queue + inflow - self.capacity * dt
+        if queue > self.buffer:
+            self.dropped += queue - self.buffer
+            queue = self.buffer
+        elif queue < 0.0:
+            queue = 0.0
+        if self.ecn_threshold is not None and queue > self.ecn_threshold:
+            self.marked += inflow
+        self.queue = queue
+
+
+class Flow:
+    """TCP sender state shared by all congestion-control algorithms"""
+
+    def __init__(self, flow_id, spec, path, links, rng):
+        self.id = flow_id
+        self.src = spec["src"]
+        self.dst = spec["dst"]
+        self.algorithm = spec["algorithm"]
+        self.path = path
+        self.links = links
+        self.base_rtt = 2.0 * sum(link.delay for link in links)
+        self.rtt = self.base_rtt
+        self.cwnd = 10.0
+        self.ssthresh = float("inf")
+        self.rate = 0.0
+        self.delivery_rate = 0.0
+        self.forwarded = [0.0] * len(links)  # this flow's arrival rate at each hop
+        self.snapshot = [0.0] * (3 * len(links))
+        self.losses = 0
+        self.ecn_marks = 0
+        self.active = False
+        self.rng = rng
+        # CUBIC
+        self.w_max = 0.0
+        self.epoch_start = None
+        self.k = 0.0
+        # BBR
+        self.mode = "startup"
+        self.bw_samples = deque(maxlen=10)
+        self.btl_bw = 0.0
+        self.min_rtt = self.base_rtt
+        self.min_rtt_stamp = 0.0
+        self.full_bw = 0.0
+        self.full_bw_count = 0
+        self.cycle_index = 0
+        self.probe_rtt_done = 0.0
+
+    def take_snapshot(self):
+        snapshot = self.snapshot
+        for i, link in enumerate(self.links):
+            snapshot[3 * i] = link.arrived
+            snapshot[3 * i + 1] = link.dropped
+            snapshot[3 * i + 2] = link.marked
+
+    def congestion_signals(self):
+        """Loss and ECN-mark probabilities seen since the previous round"""
+        keep = 1.0
+        unmarked = 1.0
+        snapshot = self.snapshot
+        for i, link in enumerate(self.links):
+            arrived = link.arrived - snapshot[3 * i]
+            if arrived > 0.0:
+                keep *= 1.0 - min((link.dropped - snapshot[3 * i + 1]) / arrived, 1.0)
+                unmarked *= 1.0 - min((link.marked - snapshot[3 * i + 2]) / arrived, 1.0)
+        return 1.0 - keep, 1.0 - unmarked
+
+
+BBR_HIGH_GAIN = 2.0 / math.log(2.0)
+BBR_CYCLE = (1.25, 0.75, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0)
+
+
+def _reno_on_round(flow, now, lost):
+    if lost:
+        flow.ssthresh = max(flow.cwnd / 2.0, 2.0)
+        flow.cwnd = flow.ssthresh
+    elif flow.cwnd < flow.ssthresh:
+        flow.cwnd = min(flow.cwnd * 2.0, max(flow.ssthresh, 2.0))
+    else:
+        flow.cwnd += 1.0
+    return flow.cwnd * MSS / flow.rtt
+
+
+def _cubic_on_round(flow, now, lost, c=0.4, beta=0.7):
+    if lost:
+        if flow.cwnd < flow.w_max:
+            flow.w_max = flow.cwnd * (1.0 + beta) / 2.0  # fast convergence
+        else:
+            flow.w_max = flow.cwnd
+        flow.cwnd = max(flow.cwnd * beta, 2.0)
+        flow.ssthresh = flow.cwnd
+        flow.epoch_start = now
+        flow.k = ((flow.w_max * (1.0 - beta)) / c) ** (1.0 / 3.0)
+    elif flow.cwnd < flow.ssthresh:
+        flow.cwnd *= 2.0
+    else:
+        if flow.epoch_start is None:
+            flow.epoch_start = now
+            flow.w_max = flow.cwnd
+            flow.k = 0.0
+        t = now - flow.epoch_start + flow.rtt
+        target = c * (t - flow.k) ** 3 + flow.w_max
+        reno_friendly = flow.w_max * beta + 3.0 * (1.0 - beta) / (1.0 + beta) * t / flow.rtt
+        flow.cwnd = min(max(target, reno_friendly, flow.cwnd), flow.cwnd * 1.5)
+    return flow.cwnd * MSS / flow.rtt
+
+
+def _bbr_on_round(flow, now, lost):
+    if flow.delivery_rate > 0.0:
+        flow.bw_samples.append(flow.delivery_rate)
+        flow.btl_bw = max(flow.bw_samples)
+    if flow.rtt <= flow.min_rtt:
+        flow.min_rtt = flow.rtt
+        flow.min_rtt_stamp = now
+    elif now - flow.min_rtt_stamp > 10.0 and flow.mode == "probe_bw":
+        # min_rtt has expired: drain the queue for a moment to measure it again
+        flow.mode = "probe_rtt"
+        flow.probe_rtt_done = now + max(0.2, flow.rtt)
+        flow.min_rtt = flow.rtt
+        flow.min_rtt_stamp = now
+
+    bdp = flow.btl_bw * flow.min_rtt
+    if flow.mode == "startup":
+        if flow.btl_bw >= flow.full_bw * 1.25:
+            flow.full_bw = flow.btl_bw
+            flow.full_bw_count = 0
+        else:
+            flow.full_bw_count += 1
+        if flow.full_bw_count >= 3:
+            flow.mode = "drain"
+        gain, cwnd_gain = BBR_HIGH_GAIN, BBR_HIGH_GAIN
+    elif flow.mode == "drain":
+        gain, cwnd_gain = 1.0 / BBR_HIGH_GAIN, BBR_HIGH_GAIN
+        if flow.rate * flow.rtt <= bdp:
+            flow.mode = "probe_bw"
+            flow.cycle_index = flow.rng.randrange(1, len(BBR_CYCLE))
+    elif flow.mode == "probe_rtt":
+        flow.cwnd = 4.0
+        if now >= flow.probe_rtt_done:
+            flow.mode = "probe_bw"
+        return flow.cwnd * MSS / flow.rtt
+    else:
+        flow.cycle_index = (flow.cycle_index + 1) % len(BBR_CYCLE)
+        gain, cwnd_gain = BBR_CYCLE[flow.cycle_index], 2.0
+
+    if flow.btl_bw <= 0.0:
+        return flow.cwnd * MSS / flow.rtt
+    flow.cwnd = max(cwnd_gain * bdp / MSS, 4.0)
+    return min(gain * flow.btl_bw, flow.cwnd * MSS / flow.rtt)
+
+
+_ON_ROUND = {"reno": _reno_on_round, "cubic": _cubic_on_round, "bbr": _bbr_on_round}
+
+
+def _build_graph(topology, params):
+    """Create a pair of directed links for every topology link"""
+    links = {}
+    adjacency = {node["id"]: [] for node in topology["nodes"]}
+    ecn_threshold = params["ecn_threshold_packets"] if params["ecn"] else None
+    for entry in topology["links"]:
+        capacity = parse_rate(entry["bandwidth"])
+        delay = parse_delay(entry.get("latency", "1 ms"))
+        for a, b in ((entry["source"], entry["target"]), (entry["target"], entry["source"])):
+            links[(a, b)] = Link(a, b, capacity, delay, params["buffer_packets"], ecn_threshold)
+            adjacency.setdefault(a, []).append(b)
+    return links, adjacency
+
+
+def _shortest_path(adjacency, src, dst):
+    if src not in adjacency or dst not in adjacency:
+        raise ValueError(f"No such node: {src if src not in adjacency else dst!r}")
+    previous = {src: None}
+    frontier = deque([src])
+    while frontier:
+        node = frontier.popleft()
+        if node == dst:
+            break
+        for neighbour in adjacency[node]:
+            if neighbour not in previous:
+                previous[neighbour] = node
+                frontier.append(neighbour)
+    if dst not in previous or src == dst:
+        raise ValueError(f"No path from {src!r} to {dst!r}")
+    path = [dst]
+    while previous[path[-1]] is not None:
+        path.append(previous[path[-1]])
+    return path[::-1]
+
+
+class Simulation:
+    """Heap-based discrete-event engine for one parameter set"""
+
+    def __init__(self, topology, params):
+        self.params = params
+        self.rng = random.Random(params["seed"])
+        self.links, adjacency = _build_graph(topology, params)
+        self.now = 0.0
+        self.events = []
+        self._seq = 0
+        self.event_count = 0
+
+        specs = params.get("flow_specs") or self._default_specs()
+        self.flows = []
+        for flow_id, spec in enumerate(specs):
+            path = _shortest_path(adjacency, spec["src"], spec["dst"])
+            flow_links = [self.links[(a, b)] for a, b in zip(path, path[1:])]
+            for link in flow_links:
+                link.flows += 1
+            flow = Flow(flow_id, spec, path, flow_links, random.Random(self.rng.random()))
+            self.flows.append(flow)
+            self.schedule(spec["start"], self._on_start, flow)
+
+        # Queueing only lengthens RTTs, so base RTTs give an upper bound on events
+        duration = params["duration"]
+        events = sum((duration - flow_spec["start"]) / max(flow.base_rtt, 1e-6)
+                     for flow_spec, flow in zip(specs, self.flows))
+        if events > MAX_EVENTS:
+            raise ValueError(f"Scenario needs about {events:,.0f} round-trip events (limit {MAX_EVENTS:,}); "
+                             f"use fewer flows, a shorter duration or longer-RTT paths")
+
+        self.used_links = [link for link in self.links.values() if link.flows]
+        self.samples = {"time": [], "cwnd": [[] for _ in self.flows],
+                        "throughput": [[] for _ in self.flows],
+                        "queue": [[] for _ in self.used_links]}
+        self.schedule(0.0, self._on_sample, None)
+
+    def _default_specs(self):
+        params = self.params
+        algorithms = params["algorithms"]
+        destinations = params["destinations"]
+        # Cycle algorithms fastest so every algorithm shares every destination's path
+        pairs = itertools.cycle(itertools.product(destinations, algorithms))
+        spread = min(params["start_spread"], params["duration"])
+        return [{"src": params["source"], "dst": dst, "algorithm": algorithm,
+                 "start": self.rng.uniform(0.0, spread)}
+                for dst, algorithm in itertools.islice(pairs, params["flows"])]
+
+    def schedule(self, at, callback, arg):
+        self._seq += 1
+        heapq.heappush(self.events, (at, self._seq, callback, arg))
+
+    def _set_rate(self, flow, rate):
+        """Offer `rate` to the path; each hop forwards at most its fair share onward"""
+        flow.rate = rate
+        forwarded = flow.forwarded
+        for i, link in enumerate(flow.links):
+            link.rate += rate - forwarded[i]
+            forwarded[i] = rate
+            if link.rate > link.capacity:
+                rate *= link.capacity / link.rate
+        flow.delivery_rate = rate
+
+    def _on_start(self, flow):
+        for link in flow.links:
+            link.advance(self.now)
+        flow.active = True
+        flow.min_rtt_stamp = self.now
+        flow.take_snapshot()
+        self._set_rate(flow, flow.cwnd * MSS / flow.rtt)
+        self.schedule(self.now + flow.rtt, self._on_round, flow)
+
+    def _on_round(self, flow):
+        now = self.now
+        queueing = 0.0
+        for link in flow.links:
+            link.advance(now)
+            queueing += link.queue / link.capacity
+        flow.rtt = flow.base_rtt + queueing
+
+        p_loss, p_mark = flow.congestion_signals()
+        packets = max(flow.cwnd, 1.0)
+        lost = p_loss > 0.0 and flow.rng.random() < 1.0 - (1.0 - p_loss) ** packets
+        marked = p_mark > 0.0 and flow.rng.random() < 1.0 - (1.0 - p_mark) ** packets
+        if lost:
+            flow.losses += 1
+        if marked:
+            flow.ecn_marks += 1
+
+        # BBR-like flows do not react to ECN; loss-based flows treat a mark as a loss
+        signal = lost or (marked and flow.algorithm != "bbr")
+        rate = _ON_ROUND[flow.algorithm](flow, now, signal)
+        flow.take_snapshot()
+        self._set_rate(flow, rate)
+        self.schedule(now + flow.rtt, self._on_round, flow)
+
+    def _on_sample(self, _):
+        now = self.now
+        samples = self.samples
+        samples["time"].append(round(now, 4))
+        for flow in self.flows:
+            samples["cwnd"][flow.id].append(round(flow.cwnd, 2) if flow.active else 0.0)
+            samples["throughput"][flow.id].append(round(flow.delivery_rate * 8e-6, 3))
+        for i, link in enumerate(self.used_links):
+            link.advance(now)
+            samples["queue"][i].append(round(link.queue / MSS, 2))
+        self.schedule(now + self.params["sample_interval"], self._on_sample, None)
+
+    def run_iter(self, checkpoints=20):
+        """Run to completion, yielding the completed fraction at each checkpoint"""
+        duration = self.params["duration"]
+        events = self.events
+        heappop = heapq.heappop
+        for step in range(1, checkpoints + 1):
+            horizon = duration * step / checkpoints
+            while events and events[0][0] <= horizon:
+                at, _, callback, arg = heappop(events)
+                self.now = at
+                callback(arg)
+                self.event_count += 1
+            yield step / checkpoints
+
+    def result(self, wall_time):
+        duration = self.params["duration"]
+        samples = self.samples
+        flows = []
+        for flow in self.flows:
+            throughput = samples["throughput"][flow.id]
+            flows.append({
+                "id": flow.id,
+                "src": flow.src,
+                "dst": flow.dst,
+                "algorithm": flow.algorithm,
+                "path": flow.path,
+                "base_rtt_ms": round(flow.base_rtt * 1e3, 3),
+                "avg_throughput_mbps": round(sum(throughput) / len(throughput), 3) if throughput else 0.0,
+                "losses": flow.losses,
+                "ecn_marks": flow.ecn_marks,
+                "cwnd": samples["cwnd"][flow.id],
+                "throughput_mbps": throughput,
+            })
+        links = []
+        for i, link in enumerate(self.used_links):
+            offered = link.capacity * duration
+            links.append({
+                "source": link.source,
+                "target": link.target,
+                "capacity_mbps": round(link.capacity * 8e-6, 3),
+                "flows": link.flows,
+                "utilization": f"{min(link.arrived - link.dropped, offered) / offered * 100:.1f}%",
+                "dropped_packets": round(link.dropped / MSS),
+                "queue_packets": samples["queue"][i],
+            })
+        rates = [flow["avg_throughput_mbps"] for flow in flows]
+        squares = sum(rate * rate for rate in rates)
+        return {
+            "params": self.params,
+            "time": samples["time"],
+            "flows": flows,
+            "links": links,
+            "summary": {
+                "events": self.event_count,
+                "wall_time": f"{wall_time:.2f} s",
+                "total_throughput_mbps": round(sum(rates), 3),
+                "jain_fairness": round(sum(rates) ** 2 / (len(rates) * squares), 4) if squares else 1.0,
+            },
+        }
+
+
+# LRU of results, bounded by the total number of time-series points held
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_points = 0
+CACHE_MAX_POINTS = 4 * MAX_SERIES_POINTS
+
+
+def _cache_key(topology, params):
+    return json.dumps({"topology": topology, "params": params}, sort_keys=True)
+
+
+def simulate_stream(topology, params, checkpoints=20):
+    """Return a generator of ('progress', info) events and a final ('result', data)
+
+    The simulation is set up before the generator is returned so that bad flow
+    endpoints raise ValueError to the caller instead of mid-stream.
+    """
+    key = _cache_key(topology, params)
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is not None:
+            _cache.move_to_end(key)
+    if entry is not None:
+        return iter([("result", entry[0])])
+    return _run_stream(key, Simulation(topology, params), checkpoints)
+
+
+def _run_stream(key, simulation, checkpoints):
+    global _cache_points
+    started = time.perf_counter()
+    for fraction in simulation.run_iter(checkpoints):
+        yield "progress", {"progress": fraction, "sim_time": round(simulation.now, 3),
+                           "events": simulation.event_count}
+    data = simulation.result(time.perf_counter() - started)
+    points = len(data["time"]) * (2 * len(data["flows"]) + len(data["links"]))
+    with _cache_lock:
+        if key not in _cache:
+            _cache[key] = (data, points)
+            _cache_points += points
+        while _cache_points > CACHE_MAX_POINTS:
+            _, (_, evicted) = _cache.popitem(last=False)
+            _cache_points -= evicted
+    yield "result", data
+
+
+def simulate(topology, params):
+    """Run (or fetch from cache) a simulation and return its result"""
+    for kind, data in simulate_stream(topology, params, checkpoints=1):
+        if kind == "result":
+            return data